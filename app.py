@@ -1,4 +1,5 @@
 import requests
+import http.cookiejar
 import time
 import json
 import os
@@ -6,13 +7,14 @@ import shutil
 from utilsServer import processTrial, runTestSession
 import traceback
 import logging
-import glob
 import random
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-import numpy as np
 from utilsAPI import (getAPIURL, getWorkerType, getErrorLogBool, getASInstance, 
                       unprotect_current_instance, get_number_of_pending_trials,
-                      getAppPullWaitTimeAndJitter, getLogLevel)
+                      getAppPullWaitTimeAndJitter, getAppPullMaxWaitTime,
+                      getAppPullLongPollWaitTime, getLogLevel)
 from utilsAuth import getToken
 from utils import (getDataDirectory, checkTime, checkResourceUsage,
                   sendStatusEmail, checkForTrialsWithStatus,
@@ -29,6 +31,14 @@ logging.basicConfig(format="[%(asctime)s] [%(levelname)s] %(message)s",
 
 API_TOKEN = getToken()
 API_URL = getAPIURL()
+# Reuse connections to the API when pulling trials (keep-alive), instead of
+# opening a new connection for every request.
+session = requests.Session()
+session.headers.update({"Authorization": "Token {}".format(API_TOKEN)})
+session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4,
+                                                        pool_maxsize=16))
+# Do not persist cookies across requests, as with one-off requests.
+session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
 workerType = getWorkerType()
 autoScalingInstance = getASInstance()
 logging.info(f"AUTOSCALING TEST INSTANCE: {autoScalingInstance}")
@@ -36,9 +46,15 @@ logging.info(f"AUTOSCALING TEST INSTANCE: {autoScalingInstance}")
 ERROR_LOG = getErrorLogBool()
 error_log_path = "/data/error_log.json"
 wait_base_time, wait_jitter = getAppPullWaitTimeAndJitter()
+wait_max_time = getAppPullMaxWaitTime()
+long_poll_wait_time = getAppPullLongPollWaitTime()
 
 # if true, will delete entire data directory when finished with a trial
 isDocker = True
+# Folders of finished trials are moved here and deleted in the background.
+trash_dir = os.path.join(getDataDirectory(isDocker=True), 'DataTrash')
+if isDocker:
+    shutil.rmtree(trash_dir, ignore_errors=True)
 
 # get start time
 initialStatusCheck = False
@@ -51,6 +67,38 @@ with_on_prem = True
 minutesBeforeRemoveScaleInProtection = 2
 max_on_prem_pending_trials = 5
 
+# Exponential backoff when pulling trials. The wait time doubles with each
+# consecutive empty pull (404), server fault (5xx), or failed request, up to
+# wait_max_time. It is reset once the condition clears. Jitter proportional
+# to the wait time keeps multiple workers from polling in lockstep.
+pull_wait_time = wait_base_time
+server_wait_time = 5
+request_wait_time = 15
+
+def getBackoffWaitTime(wait_time):
+    return wait_time + random.uniform(0, 0.1*wait_time)
+
+# Work that does not need to block the worker (posting client info and
+# deleting the folders of finished trials) is run in the background, such that
+# it overlaps with trial processing and with pulling the next trial.
+backgroundExecutor = ThreadPoolExecutor(max_workers=4)
+
+def submitBackgroundRequest(trial, func, *args):
+    future = backgroundExecutor.submit(func, *args)
+
+    # Only log here: this runs in an executor thread, and the error log file
+    # is written by the main thread without locking.
+    def logException(future):
+        e = future.exception()
+        if e is None:
+            return
+        stack = ''.join(traceback.format_exception(type(e), e, e.__traceback__))
+        logging.error("Background request failed for trial {} (session {}):\n{}".format(
+            trial["id"], trial["session"], stack))
+
+    future.add_done_callback(logException)
+    return future
+
 while True:
     # Run test trial at a given frequency to check status of machine. Stop machine if fails.
     if checkTime(t,minutesElapsed=30) or not initialStatusCheck:
@@ -79,20 +127,44 @@ while True:
     # workerType = 'all' -> processes all types of trials
     # no query string -> defaults to 'all'
     queue_path = "trials/dequeue/?workerType=" + workerType
+    # With long polling, the API holds the request until a trial is ready or
+    # until wait seconds have elapsed, in which case it returns 204.
+    if long_poll_wait_time > 0:
+        params = {"wait": long_poll_wait_time}
+        timeout = long_poll_wait_time + 5
+    else:
+        params = None
+        timeout = None
     try:
-        r = requests.get("{}{}".format(API_URL, queue_path),
-                         headers = {"Authorization": "Token {}".format(API_TOKEN)})
+        r = session.get("{}{}".format(API_URL, queue_path), params=params,
+                        timeout=timeout)
+    except requests.exceptions.ReadTimeout:
+        if long_poll_wait_time > 0:
+            # No response within the long polling window, pull again.
+            continue
+        traceback.print_exc()
+        time.sleep(getBackoffWaitTime(request_wait_time))
+        request_wait_time = min(2*request_wait_time, wait_max_time)
+        continue
     except Exception as e:
         traceback.print_exc()
-        time.sleep(15)
+        time.sleep(getBackoffWaitTime(request_wait_time))
+        request_wait_time = min(2*request_wait_time, wait_max_time)
         continue
+    request_wait_time = 15
 
-    if r.status_code == 404:
+    if r.status_code in [204, 404]:
         logging.info(f"...pulling {workerType} trials from {API_URL} "
                      f"using commit {getCommitHash()}")
-        wait_time = wait_base_time + random.uniform(-wait_jitter, wait_jitter)
-        time.sleep(wait_time)
-        logging.debug(f'waiting {wait_time} seconds')
+        # 204 means the API already waited during long polling, so we can
+        # pull again right away.
+        if r.status_code == 404:
+            wait_time = (getBackoffWaitTime(pull_wait_time) +
+                         random.uniform(-wait_jitter, wait_jitter))
+            time.sleep(max(wait_time, 0))
+            logging.debug(f'waiting {wait_time} seconds')
+            pull_wait_time = min(2*pull_wait_time, wait_max_time)
+        server_wait_time = 5
         
         # When using autoscaling, we will remove the instance scale-in protection if it hasn't
         # pulled a trial recently and there are no actively recording trials
@@ -116,10 +188,13 @@ while True:
             
         continue
     
-    if np.floor(r.status_code/100) == 5: # 5xx codes are server faults
+    if 500 <= r.status_code < 600: # 5xx codes are server faults
         logging.info("API unresponsive. Status code = {:.0f}.".format(r.status_code))
-        time.sleep(5)
+        time.sleep(getBackoffWaitTime(server_wait_time))
+        server_wait_time = min(2*server_wait_time, wait_max_time)
         continue
+    server_wait_time = 5
+    pull_wait_time = wait_base_time
     
     # Check resource usage
     resourceUsage = checkResourceUsage(stop_machine_and_email=True)
@@ -131,7 +206,7 @@ while True:
     logging.info(trial_url)
     logging.info(trial)
     
-    if len(trial["videos"]) == 0:
+    if not trial["videos"]:
         error_msg = {}
         error_msg['error_msg'] = 'No videos uploaded. Ensure phones are connected and you have stable internet connection.'
         error_msg['error_msg_dev'] = 'No videos uploaded.'
@@ -169,41 +244,24 @@ while True:
 
     try:
         # Post new client info to Trial and start timer for processing duration
-        postLocalClientInfo(trial_url)
         process_start_time = datetime.now()
+        submitBackgroundRequest(trial, postLocalClientInfo, trial_url)
 
         # trigger reset of timer for last processed trial              
         processTrial(trial["session"], trial["id"], trial_type=trial_type, isDocker=isDocker)
 
         # note a result needs to be posted for the API to know we finished, but we are posting them 
         # automatically thru procesTrial now
-        r = makeRequestWithRetry('PATCH',
-                                 trial_url,
-                                 data={"status": "done"},
-                                 headers = {"Authorization": "Token {}".format(API_TOKEN)})
-
-        logging.info('0.5s pause if need to restart.')
-        time.sleep(0.5)
+        trial_status = "done"
 
     except Exception as e:
-        try:
-            r = makeRequestWithRetry('PATCH',
-                                     trial_url, data={"status": "error"},
-                                     headers = {"Authorization": "Token {}".format(API_TOKEN)})
-            traceback.print_exc()
-
-            if ERROR_LOG:
-                stack = traceback.format_exc()
-                writeToErrorLog(error_log_path, trial["session"], trial["id"],
-                                e, stack)
-
-        except:
-            traceback.print_exc()
+        trial_status = "error"
+        traceback.print_exc()
 
-            if ERROR_LOG:
-                stack = traceback.format_exc()
-                writeToErrorLog(error_log_path, trial["session"], trial["id"],
-                                e, stack)
+        if ERROR_LOG:
+            stack = traceback.format_exc()
+            writeToErrorLog(error_log_path, trial["session"], trial["id"],
+                            e, stack)
 
         # Antoine: Removing this, it is too often causing the machines to stop. Not because
         # the machines are failing, but because for instance the video is very long with a lot
@@ -215,25 +273,38 @@ while True:
         #     message = "A backend OpenCap machine timed out during pose detection. It has been stopped."
         #     sendStatusEmail(message=message)
         #     raise Exception('Worker failed. Stopped.')
-    
-    finally:
-        # End process duration timer and post duration to database
-        try:
-            process_end_time = datetime.now()
-            postProcessedDuration(trial_url, process_end_time - process_start_time)
-        except Exception as e:
-            traceback.print_exc()
 
-            if ERROR_LOG:
-                stack = traceback.format_exc()
-                writeToErrorLog(error_log_path, trial["session"], trial["id"],
-                                e, stack)
+    # End process duration timer and post duration to database. The duration
+    # is posted with the trial status such that a single request is needed.
+    process_end_time = datetime.now()
+    try:
+        r = postProcessedDuration(trial_url,
+                                  process_end_time - process_start_time,
+                                  status=trial_status)
+    except Exception as e:
+        traceback.print_exc()
+
+        if ERROR_LOG:
+            stack = traceback.format_exc()
+            writeToErrorLog(error_log_path, trial["session"], trial["id"],
+                            e, stack)
+
+    if trial_status == "done":
+        logging.info('0.5s pause if need to restart.')
+        time.sleep(0.5)
 
     justProcessed = True
     
-    # Clean data directory
+    # Clean data directory. Folders are moved out of the data directory first,
+    # which is a cheap rename, such that the next trial can be pulled while
+    # they are being deleted.
     if isDocker:
-        folders = glob.glob(os.path.join(getDataDirectory(isDocker=True),'Data','*'))
-        for f in folders:         
-            shutil.rmtree(f)
+        with os.scandir(os.path.join(getDataDirectory(isDocker=True),'Data')) as entries:
+            folders = [entry.path for entry in entries if entry.is_dir()]
+        os.makedirs(trash_dir, exist_ok=True)
+        for f in folders:
+            trash_folder = os.path.join(trash_dir, uuid.uuid4().hex)
+            os.rename(f, trash_folder)
+            backgroundExecutor.submit(shutil.rmtree, trash_folder,
+                                      ignore_errors=True)
             logging.info('deleting ' + f)
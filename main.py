@@ -9,14 +9,15 @@
 
 import os 
 import glob
-import numpy as np
+import copy
 import yaml
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 import logging
 logging.basicConfig(level=logging.INFO)
 
-from utils import importMetadata, loadCameraParameters, getVideoExtension
+from utils import importMetadata, loadCameraParametersCached, getVideoExtension
 from utils import getDataDirectory, getOpenPoseDirectory, getMMposeDirectory
 from utilsChecker import saveCameraParameters
 from utilsChecker import calcExtrinsicsFromVideo
@@ -29,9 +30,93 @@ from utilsChecker import rotateIntrinsics
 from utilsSync import synchronizeVideos
 from utilsDetector  import runPoseDetector
 from utilsAugmenter import augmentTRC
-from utilsOpenSim import runScaleTool, getScaleTimeRange, runIKTool, generateVisualizerJson
+from utilsOpenSim import runScaleTool, runIKTool, generateVisualizerJson
+from utilsOpenSim import loadScaleTimeRangeData, getScaleTimeRangeFromArray
 from defaults import DEFAULT_SYNC_VER
 
+# Paths to the repository folders used by the pipeline.
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+_INTRINSICS_DIR = os.path.join(_BASE_DIR, 'CameraIntrinsics')
+_AUGMENTER_DIR = os.path.join(_BASE_DIR, 'MarkerAugmenter')
+_OPENSIM_PIPELINE_DIR = os.path.join(_BASE_DIR, 'opensimPipeline')
+
+# Rotation angles from motion capture environment to OpenSim, by checkerboard
+# placement. Space-fixed are lowercase, Body-fixed are uppercase.
+_ROTATION_ANGLES = {
+    'backWall': {'y':90, 'z':180},
+    'Perpendicular': {'y':90, 'z':180},
+    'ground': {'x':90, 'y':90},
+    'Lying': {'x':90, 'y':90},
+    }
+# Rotation angles when the checkerboard is upside down (backwall placements).
+_ROTATION_ANGLES_UPSIDE_DOWN = {
+    'backWall': {'y':-90},
+    'Perpendicular': {'y':-90},
+    }
+
+# Use the LibYAML-based dumper when available, it is much faster than the
+# pure Python one.
+_YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+def writeSettings(pathSettings, settings):
+    # Write to a temporary file first, such that the settings file is
+    # replaced atomically.
+    pathSettingsTmp = pathSettings + '.tmp'
+    with open(pathSettingsTmp, 'w') as file:
+        yaml.dump(settings, file, Dumper=_YAML_DUMPER)
+    os.replace(pathSettingsTmp, pathSettings)
+
+# Output folder names only depend on the processing settings.
+def getOutputFolderNames(poseDetector, resolutionPoseDetection, bbox_thr,
+                         augmenterModel, genericFolderNames=False,
+                         markerDataFolderNameSuffix=None):
+    if poseDetector == 'mmpose':
+        outputMediaFolder = 'OutputMedia_mmpose' + str(bbox_thr)
+        suff_pd = '_' + str(bbox_thr)
+    elif poseDetector == 'OpenPose':
+        outputMediaFolder = 'OutputMedia_' + resolutionPoseDetection
+        suff_pd = '_' + resolutionPoseDetection
+    
+    if genericFolderNames:
+        markerDataFolderName = 'MarkerData'
+        postAugmentationFolderName = 'PostAugmentation'
+        openSimFolderName = 'OpenSimData'
+    else:
+        markerDataFolderName = os.path.join('MarkerData', 
+                                            poseDetector + suff_pd)
+        postAugmentationFolderName = 'PostAugmentation_{}'.format(
+            augmenterModel)
+        openSimFolderName = os.path.join('OpenSimData', 
+                                         poseDetector + suff_pd)
+        if not markerDataFolderNameSuffix is None:
+            markerDataFolderName = os.path.join(markerDataFolderName,
+                                                markerDataFolderNameSuffix)
+            openSimFolderName = os.path.join(openSimFolderName,
+                                             markerDataFolderNameSuffix)
+            
+    return (outputMediaFolder, markerDataFolderName,
+            postAugmentationFolderName, openSimFolderName)
+
+def calcExtrinsicsForCamera(extrinsicPath, CamParams, CheckerBoardParams,
+                            imageUpsampleFactor, useSecondExtrinsicsSolution):
+    # Modify intrinsics if camera view is rotated
+    CamParams = rotateIntrinsics(CamParams,extrinsicPath)
+    
+    # for 720p, imageUpsampleFactor=4 is best for small board
+    try:
+        CamParams = calcExtrinsicsFromVideo(
+            extrinsicPath,CamParams, CheckerBoardParams, 
+            visualize=False, imageUpsampleFactor=imageUpsampleFactor,
+            useSecondExtrinsicsSolution = useSecondExtrinsicsSolution)
+    except Exception as e:
+        if len(e.args) == 2: # specific exception
+            raise Exception(e.args[0], e.args[1])
+        elif len(e.args) == 1: # generic exception
+            exception = "Camera calibration failed. Verify your setup and try again. Visit https://www.opencap.ai/best-pratices to learn more about camera calibration and https://www.opencap.ai/troubleshooting for potential causes for a failed calibration."
+            raise Exception(exception, traceback.format_exc())
+            
+    return CamParams
+
 def main(sessionName, trialName, trial_id, cameras_to_use=['all'],
          intrinsicsFinalFolder='Deployed', isDocker=False,
          extrinsicsTrial=False, alternateExtrinsics=None, 
@@ -43,7 +128,7 @@ def main(sessionName, trialName, trial_id, cameras_to_use=['all'],
          dataDir=None, overwriteAugmenterModel=False,
          filter_frequency='default', overwriteFilterFrequency=False,
          scaling_setup='upright_standing_pose', overwriteScalingSetup=False,
-         overwriteCamerasToUse=False, syncVer=None,):
+         overwriteCamerasToUse=False, syncVer=None, knownIntrinsics=None):
 
     # %% High-level settings.
     # Camera calibration.
@@ -69,10 +154,6 @@ def main(sessionName, trialName, trial_id, cameras_to_use=['all'],
         poseDetector = 'mmpose'        
     elif poseDetector == 'openpose':
         poseDetector = 'OpenPose'
-    if poseDetector == 'mmpose':
-        outputMediaFolder = 'OutputMedia_mmpose' + str(bbox_thr)
-    elif poseDetector == 'OpenPose':
-        outputMediaFolder = 'OutputMedia_' + resolutionPoseDetection
     
     # %% Special case: extrinsics trial.
     # For that trial, we only calibrate the cameras.
@@ -85,13 +166,9 @@ def main(sessionName, trialName, trial_id, cameras_to_use=['all'],
         runOpenSimPipeline = False
         
     # %% Paths and metadata. This gets defined through web app.
-    baseDir = os.path.dirname(os.path.abspath(__file__))
     if dataDir is None:
         dataDir = getDataDirectory(isDocker)
-    if 'dataDir' not in locals():
-        sessionDir = os.path.join(baseDir, 'Data', sessionName)
-    else:
-        sessionDir = os.path.join(dataDir, 'Data', sessionName)
+    sessionDir = os.path.join(dataDir, 'Data', sessionName)
     sessionMetadata = importMetadata(os.path.join(sessionDir,
                                                   'sessionMetadata.yaml'))
     
@@ -143,33 +220,32 @@ def main(sessionName, trialName, trial_id, cameras_to_use=['all'],
         poseDetectorDirectory = getMMposeDirectory(isDocker)    
         
     # %% Create marker folders
-    # Create output folder.
-    if genericFolderNames:
-        markerDataFolderName = os.path.join('MarkerData') 
-    else:
-        if poseDetector == 'mmpose':
-            suff_pd = '_' + str(bbox_thr)
-        elif poseDetector == 'OpenPose':
-            suff_pd = '_' + resolutionPoseDetection
-                
-        markerDataFolderName = os.path.join('MarkerData', 
-                                            poseDetector + suff_pd) 
-        if not markerDataFolderNameSuffix is None:
-            markerDataFolderName = os.path.join(markerDataFolderName,
-                                                markerDataFolderNameSuffix)
+    (outputMediaFolder, markerDataFolderName, postAugmentationFolderName,
+     openSimFolderName) = getOutputFolderNames(
+         poseDetector, resolutionPoseDetection, bbox_thr, augmenterModel,
+         genericFolderNames=genericFolderNames,
+         markerDataFolderNameSuffix=markerDataFolderNameSuffix)
+    # Output folders.
     preAugmentationDir = os.path.join(sessionDir, markerDataFolderName,
                                       'PreAugmentation')
-    os.makedirs(preAugmentationDir, exist_ok=True)
+    postAugmentationDir = os.path.join(sessionDir, markerDataFolderName, 
+                                       postAugmentationFolderName)
+    openSimDir = os.path.join(sessionDir, openSimFolderName)
+    outputScaledModelDir = os.path.join(openSimDir, 'Model')
+    outputIKDir = os.path.join(openSimDir, 'Kinematics')
+    staticImagesFolderDir = os.path.join(sessionDir, 'NeutralPoseImages')
+    outputJsonVisDir = os.path.join(sessionDir, 'VisualizerJsons', trialName)
     
-    # Create augmented marker folders as well
-    if genericFolderNames:
-        postAugmentationDir = os.path.join(sessionDir, markerDataFolderName, 
-                                           'PostAugmentation')
-    else:
-        postAugmentationDir = os.path.join(
-            sessionDir, markerDataFolderName, 
-            'PostAugmentation_{}'.format(augmenterModel))
-    os.makedirs(postAugmentationDir, exist_ok=True)
+    # Create all output folders needed by this trial in one pass.
+    neededDirs = [preAugmentationDir, postAugmentationDir]
+    if runOpenSimPipeline:
+        if scaleModel:
+            neededDirs += [outputScaledModelDir, staticImagesFolderDir]
+        else:
+            neededDirs.append(outputIKDir)
+        neededDirs.append(outputJsonVisDir)
+    for neededDir in neededDirs:
+        os.makedirs(neededDir, exist_ok=True)
         
     # %% Dump settings in yaml.
     if not extrinsicsTrial:
@@ -187,8 +263,7 @@ def main(sessionName, trialName, trial_id, cameras_to_use=['all'],
             settings['resolutionPoseDetection'] = resolutionPoseDetection
         elif poseDetector == 'mmpose':
             settings['bbox_thr'] = bbox_thr
-        with open(pathSettings, 'w') as file:
-            yaml.dump(settings, file)
+        writeSettings(pathSettings, settings)
 
     # %% Camera calibration.
     if runCameraCalibration:    
@@ -202,19 +277,19 @@ def main(sessionName, trialName, trial_id, cameras_to_use=['all'],
         # Camera directories and models.
         cameraDirectories = {}
         cameraModels = {}
-        for pathCam in glob.glob(os.path.join(sessionDir, 'Videos', 'Cam*')):
-            if os.name == 'nt': # windows
-                camName = pathCam.split('\\')[-1]
-            elif os.name == 'posix': # ubuntu
-                camName = pathCam.split('/')[-1]
-            cameraDirectories[camName] = os.path.join(sessionDir, 'Videos',
-                                                      pathCam)
+        with os.scandir(os.path.join(sessionDir, 'Videos')) as entries:
+            camEntries = [entry for entry in entries 
+                          if entry.name.startswith('Cam') and entry.is_dir()]
+        for camEntry in camEntries:
+            camName = camEntry.name
+            cameraDirectories[camName] = camEntry.path
             cameraModels[camName] = sessionMetadata['iphoneModel'][camName]        
         
         # Get cameras' intrinsics and extrinsics.     
         # Load parameters if saved, compute and save them if not.
         CamParamDict = {}
         loadedCamParams = {}
+        extrinsicsArgs = {}
         for camName in cameraDirectories:
             camDir = cameraDirectories[camName]
             # Intrinsics ######################################################
@@ -223,7 +298,7 @@ def main(sessionName, trialName, trial_id, cameras_to_use=['all'],
                     os.path.join(camDir,"cameraIntrinsicsExtrinsics.pickle")):
                 logging.info("Load extrinsics for {} - already existing".format(
                     camName))
-                CamParams = loadCameraParameters(
+                CamParams = loadCameraParametersCached(
                     os.path.join(camDir, "cameraIntrinsicsExtrinsics.pickle"))
                 loadedCamParams[camName] = True
                 
@@ -232,13 +307,16 @@ def main(sessionName, trialName, trial_id, cameras_to_use=['all'],
                 logging.info("Compute extrinsics for {} - not yet existing".format(camName))
                 # Intrinsics ##################################################
                 # Intrinsics directories.
-                intrinsicDir = os.path.join(baseDir, 'CameraIntrinsics',
+                intrinsicDir = os.path.join(_INTRINSICS_DIR,
                                             cameraModels[camName])
                 permIntrinsicDir = os.path.join(intrinsicDir, 
                                                 intrinsicsFinalFolder)            
+                # Intrinsics provided by the caller, skip the lookup.
+                if knownIntrinsics is not None and camName in knownIntrinsics:
+                    CamParams = copy.deepcopy(knownIntrinsics[camName])
                 # Intrinsics exist.
-                if os.path.exists(permIntrinsicDir):
-                    CamParams = loadCameraParameters(
+                elif os.path.exists(permIntrinsicDir):
+                    CamParams = loadCameraParametersCached(
                         os.path.join(permIntrinsicDir,
                                       'cameraIntrinsics.pickle'))                    
                 # Intrinsics do not exist throw an error. Eventually the
@@ -260,38 +338,44 @@ def main(sessionName, trialName, trial_id, cameras_to_use=['all'],
                 extension = getVideoExtension(pathVideoWithoutExtension)
                 extrinsicPath = os.path.join(camDir, 'InputMedia', trialName, 
                                              trial_id + extension) 
-                                              
-                # Modify intrinsics if camera view is rotated
-                CamParams = rotateIntrinsics(CamParams,extrinsicPath)
-                
-                # for 720p, imageUpsampleFactor=4 is best for small board
-                try:
-                    CamParams = calcExtrinsicsFromVideo(
-                        extrinsicPath,CamParams, CheckerBoardParams, 
-                        visualize=False, imageUpsampleFactor=imageUpsampleFactor,
-                        useSecondExtrinsicsSolution = useSecondExtrinsicsSolution)
-                except Exception as e:
-                    if len(e.args) == 2: # specific exception
-                        raise Exception(e.args[0], e.args[1])
-                    elif len(e.args) == 1: # generic exception
-                        exception = "Camera calibration failed. Verify your setup and try again. Visit https://www.opencap.ai/best-pratices to learn more about camera calibration and https://www.opencap.ai/troubleshooting for potential causes for a failed calibration."
-                        raise Exception(exception, traceback.format_exc())
+                extrinsicsArgs[camName] = (
+                    extrinsicPath, CamParams, CheckerBoardParams,
+                    imageUpsampleFactor, useSecondExtrinsicsSolution)
                 loadedCamParams[camName] = False
-                
-       
-            # Append camera parameters.
-            if CamParams is not None:
-                CamParamDict[camName] = CamParams.copy()
+            
+            CamParamDict[camName] = CamParams
+            
+        # Compute extrinsics. This is CPU-heavy (checkerboard detection on
+        # upsampled images) and independent across cameras, so we use one
+        # thread per camera. OpenCV and the ffmpeg calls release the GIL, and
+        # threads avoid forking this (multithreaded) worker process.
+        if len(extrinsicsArgs) > 1:
+            if hasattr(os, 'sched_getaffinity'): # respects container cpusets
+                nCPUs = len(os.sched_getaffinity(0))
             else:
-                CamParamDict[camName] = None
-
+                nCPUs = os.cpu_count() or 1
+            nWorkers = min(len(extrinsicsArgs), nCPUs)
+            with ThreadPoolExecutor(max_workers=nWorkers) as executor:
+                futures = {
+                    camName: executor.submit(calcExtrinsicsForCamera, *args)
+                    for camName, args in extrinsicsArgs.items()}
+                for camName in futures:
+                    CamParamDict[camName] = futures[camName].result()
+        else:
+            for camName, args in extrinsicsArgs.items():
+                CamParamDict[camName] = calcExtrinsicsForCamera(*args)
+       
         # Save parameters if not existing yet.
         if not all([loadedCamParams[i] for i in loadedCamParams]):
-            for camName in CamParamDict:
-                saveCameraParameters(
-                    os.path.join(cameraDirectories[camName],
-                                 "cameraIntrinsicsExtrinsics.pickle"), 
-                    CamParamDict[camName])
+            # One file per camera, write them concurrently.
+            with ThreadPoolExecutor(
+                    max_workers=max(len(CamParamDict), 1)) as executor:
+                list(executor.map(
+                    lambda camName: saveCameraParameters(
+                        os.path.join(cameraDirectories[camName],
+                                     "cameraIntrinsicsExtrinsics.pickle"), 
+                        CamParamDict[camName]),
+                    CamParamDict))
             
     # %% 3D reconstruction
     
@@ -309,20 +393,16 @@ def main(sessionName, trialName, trial_id, cameras_to_use=['all'],
     
     if runPoseDetection:
         # Get rotation angles from motion capture environment to OpenSim.
-        # Space-fixed are lowercase, Body-fixed are uppercase. 
         checkerBoardMount = sessionMetadata['checkerBoard']['placement']
-        if checkerBoardMount == 'backWall' or checkerBoardMount == 'Perpendicular':
-            # Detect if checkerboard is upside down.
-            upsideDownChecker = isCheckerboardUpsideDown(CamParamDict)
-            if upsideDownChecker:
-                rotationAngles = {'y':-90}
-            else:
-                rotationAngles = {'y':90, 'z':180}
-        elif checkerBoardMount == 'ground' or checkerBoardMount == 'Lying':
-            rotationAngles = {'x':90, 'y':90}
-        else:
+        if checkerBoardMount not in _ROTATION_ANGLES:
             raise Exception('checkerBoard placement value in\
              sessionMetadata.yaml is not currently supported')
+        # Detect if checkerboard is upside down.
+        if (checkerBoardMount in _ROTATION_ANGLES_UPSIDE_DOWN and 
+                isCheckerboardUpsideDown(CamParamDict)):
+            rotationAngles = _ROTATION_ANGLES_UPSIDE_DOWN[checkerBoardMount]
+        else:
+            rotationAngles = _ROTATION_ANGLES[checkerBoardMount]
              
         # Detect all available cameras (ie, cameras with existing videos).
         cameras_available = []
@@ -470,14 +550,12 @@ def main(sessionName, trialName, trial_id, cameras_to_use=['all'],
                     postAugmentationDir, trial_id + "_" + augmenterModelName +".trc")
     
     if runMarkerAugmentation:
-        os.makedirs(postAugmentationDir, exist_ok=True)    
-        augmenterDir = os.path.join(baseDir, "MarkerAugmenter")
         logging.info('Augmenting marker set')
         try:
             vertical_offset = augmentTRC(
                 pathOutputFiles[trialName],sessionMetadata['mass_kg'], 
                 sessionMetadata['height_m'], pathAugmentedOutputFiles[trialName],
-                augmenterDir, augmenterModelName=augmenterModelName,
+                _AUGMENTER_DIR, augmenterModelName=augmenterModelName,
                 augmenter_model=augmenterModel, offset=offset)
         except Exception as e:
             if len(e.args) == 2: # specific exception
@@ -488,24 +566,11 @@ def main(sessionName, trialName, trial_id, cameras_to_use=['all'],
         if offset:
             # If offset, no need to offset again for the webapp visualization.
             # (0.01 so that there is no overall offset, see utilsOpenSim).
-            vertical_offset_settings = float(np.copy(vertical_offset)-0.01)
+            vertical_offset_settings = float(vertical_offset) - 0.01
             vertical_offset = 0.01   
         
     # %% OpenSim pipeline.
     if runOpenSimPipeline:
-        openSimPipelineDir = os.path.join(baseDir, "opensimPipeline")        
-        
-        if genericFolderNames:
-            openSimFolderName = 'OpenSimData'
-        else:
-            openSimFolderName = os.path.join('OpenSimData', 
-                                             poseDetector + suff_pd)
-            if not markerDataFolderNameSuffix is None:
-                openSimFolderName = os.path.join(openSimFolderName,
-                                                 markerDataFolderNameSuffix)
-        
-        openSimDir = os.path.join(sessionDir, openSimFolderName)        
-        outputScaledModelDir = os.path.join(openSimDir, 'Model')
 
         # Check if shoulder model.
         if 'shoulder' in sessionMetadata['openSimModel']:
@@ -515,7 +580,6 @@ def main(sessionName, trialName, trial_id, cameras_to_use=['all'],
         
         # Scaling.    
         if scaleModel:
-            os.makedirs(outputScaledModelDir, exist_ok=True)
             # Path setup file.
             if scalingSetup == 'any_pose':
                 genericSetupFile4ScalingName = 'Setup_scaling_LaiUhlrich2022_any_pose.xml'
@@ -523,10 +587,10 @@ def main(sessionName, trialName, trial_id, cameras_to_use=['all'],
                 genericSetupFile4ScalingName = 'Setup_scaling_LaiUhlrich2022.xml'
 
             pathGenericSetupFile4Scaling = os.path.join(
-                openSimPipelineDir, 'Scaling', genericSetupFile4ScalingName)
+                _OPENSIM_PIPELINE_DIR, 'Scaling', genericSetupFile4ScalingName)
             # Path model file.
             pathGenericModel4Scaling = os.path.join(
-                openSimPipelineDir, 'Models', 
+                _OPENSIM_PIPELINE_DIR, 'Models', 
                 sessionMetadata['openSimModel'] + '.osim')            
             # Path TRC file.
             pathTRCFile4Scaling = pathAugmentedOutputFiles[trialName]
@@ -536,12 +600,15 @@ def main(sessionName, trialName, trial_id, cameras_to_use=['all'],
                 maxThreshold = 0.015
                 increment = 0.001
                 success = False
+                # Load the trajectories once, only the threshold changes.
+                trcTime4Scaling, trcData4Scaling = loadScaleTimeRangeData(
+                    pathTRCFile4Scaling, removeRoot=True)
                 while thresholdPosition <= maxThreshold and not success:
                     try:
-                        timeRange4Scaling = getScaleTimeRange(
-                            pathTRCFile4Scaling,
+                        timeRange4Scaling = getScaleTimeRangeFromArray(
+                            trcTime4Scaling, trcData4Scaling,
                             thresholdPosition=thresholdPosition,
-                            thresholdTime=0.1, removeRoot=True)
+                            thresholdTime=0.1)
                         success = True
                     except Exception as e:
                         logging.info(f"Attempt identifying scaling time range with thresholdPosition {thresholdPosition} failed: {e}")
@@ -562,9 +629,6 @@ def main(sessionName, trialName, trial_id, cameras_to_use=['all'],
                     exception = "Musculoskeletal model scaling failed. Verify your setup and try again. Visit https://www.opencap.ai/best-pratices to learn more about data collection and https://www.opencap.ai/troubleshooting for potential causes for a failed neutral pose."
                     raise Exception(exception, traceback.format_exc())
             # Extract one frame from videos to verify neutral pose.
-            staticImagesFolderDir = os.path.join(sessionDir, 
-                                                 'NeutralPoseImages')
-            os.makedirs(staticImagesFolderDir, exist_ok=True)
             popNeutralPoseImages(cameraDirectories, cameras2Use, 
                                  timeRange4Scaling[0], staticImagesFolderDir,
                                  trial_id, writeVideo = True)   
@@ -573,8 +637,6 @@ def main(sessionName, trialName, trial_id, cameras_to_use=['all'],
         
         # Inverse kinematics.
         if not scaleModel:
-            outputIKDir = os.path.join(openSimDir, 'Kinematics')
-            os.makedirs(outputIKDir, exist_ok=True)
             # Check if there is a scaled model.
             pathScaledModel = os.path.join(outputScaledModelDir, 
                                             sessionMetadata['openSimModel'] + 
@@ -583,7 +645,7 @@ def main(sessionName, trialName, trial_id, cameras_to_use=['all'],
                 # Path setup file.
                 genericSetupFile4IKName = 'Setup_IK{}.xml'.format(suffix_model)
                 pathGenericSetupFile4IK = os.path.join(
-                    openSimPipelineDir, 'IK', genericSetupFile4IKName)
+                    _OPENSIM_PIPELINE_DIR, 'IK', genericSetupFile4IKName)
                 # Path TRC file.
                 pathTRCFile4IK = pathAugmentedOutputFiles[trialName]
                 # Run IK tool. 
@@ -602,9 +664,6 @@ def main(sessionName, trialName, trial_id, cameras_to_use=['all'],
                 raise ValueError("No scaled model available.")
         
         # Write body transforms to json for visualization.
-        outputJsonVisDir = os.path.join(sessionDir,'VisualizerJsons',
-                                        trialName)
-        os.makedirs(outputJsonVisDir,exist_ok=True)
         outputJsonVisPath = os.path.join(outputJsonVisDir,
                                          trialName + '.json')
         generateVisualizerJson(pathModelIK, pathOutputIK,
@@ -616,5 +675,4 @@ def main(sessionName, trialName, trial_id, cameras_to_use=['all'],
     if not extrinsicsTrial:
         if offset:
             settings['verticalOffset'] = vertical_offset_settings 
-        with open(pathSettings, 'w') as file:
-            yaml.dump(settings, file)
+        writeSettings(pathSettings, settings)
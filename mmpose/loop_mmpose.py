@@ -1,11 +1,23 @@
+import gc
 import os
+# Must be set before torch initializes CUDA. Caps the size of blocks the
+# caching allocator splits, which limits fragmentation between the large
+# detector activations and the many small pose crops. expandable_segments is
+# not used since it needs torch>=2.1, and older versions reject unknown keys.
+os.environ.setdefault('PYTORCH_CUDA_ALLOC_CONF', 'max_split_size_mb:512')
 import time
 import logging
-import shutil
 import json
 import torch
 
-from utilsMMpose import detection_inference, pose_inference
+from utilsMMpose import detection_inference, pose_inference, warmup_models
+from mmdet.apis import init_detector
+from mmpose_inference import init_pose_model
+try:
+    from inotify_simple import INotify, flags
+    has_inotify = True
+except (ImportError, ModuleNotFoundError):
+    has_inotify = False
 
 logging.basicConfig(level=logging.INFO)
 
@@ -23,6 +35,17 @@ video_path = "/mmpose/data/video_mmpose.mov"
 output_dir = "/mmpose/data/output_mmpose"
 
 generateVideo=False
+# Number of frames run through the person detector at once.
+det_batch_size = 16
+# Worker processes preprocessing the pose crops while the GPU runs.
+pose_num_workers = 4
+# Run both models under fp16 autocast (faster on tensor-core GPUs, but
+# keypoints are not bit-identical to fp32).
+fp16 = False
+# Run HRNet in NHWC (channels_last) layout. Mainly helps fp16 on tensor-core
+# GPUs (fp32 NHWC convolutions can be slower on older ones), and keypoints are
+# not bit-identical, so it follows fp16 until measured on the deployed GPUs.
+channels_last = fp16
 
 with open('/mmpose/defaultOpenCapSettings.json') as f:
     defaultOpenCapSettings = json.load(f)
@@ -31,46 +54,92 @@ model_config_person='/mmpose/faster_rcnn_r50_fpn_coco.py'
 model_ckpt_person='/mmpose/faster_rcnn_r50_fpn_1x_coco_20200130-047c8118.pth'
 model_config_pose='/mmpose/hrnet_w48_coco_wholebody_384x288_dark_plus.py'
 model_ckpt_pose='/mmpose/hrnet_w48_coco_wholebody_384x288_dark-f5726563_20200918.pth'
+
+# The video is moved into place once fully copied, wake up on that instead
+# of polling the path.
+if has_inotify:
+    inotify = INotify()
+    inotify.add_watch(os.path.dirname(video_path),
+                      flags.CLOSE_WRITE | flags.MOVED_TO)
+
+def waitForVideo():
+    while not os.path.isfile(video_path):
+        if has_inotify:
+            # Timeout so that a missed event only delays processing.
+            inotify.read(timeout=1000)
+        else:
+            time.sleep(0.1)
     
 if os.path.isfile(video_path):
     os.remove(video_path)
 
+os.makedirs(output_dir, exist_ok=True)
+
 checkCudaPyTorch()
+
+# Initialize the models once, they stay on the GPU across videos.
+device = 'cuda:0'
+det_model = init_detector(model_config_person, model_ckpt_person,
+                          device=device)
+pose_model = init_pose_model(model_config_pose, model_ckpt_pose, device)
+if channels_last:
+    pose_model = pose_model.to(memory_format=torch.channels_last)
+
+# Input shapes repeat across videos, so let cuDNN pick the fastest kernels
+# and pay for the autotuning once, before the first video arrives.
+torch.backends.cudnn.benchmark = True
+warmup_models(det_model, pose_model, det_batch_size=det_batch_size, fp16=fp16,
+              channels_last=channels_last)
+logging.info("mmpose: Models ready.")
+
 while True:    
-    if not os.path.isfile(video_path):
-        time.sleep(0.1)
-        continue
+    waitForVideo()
 
     logging.info("Processing mmpose...")
 
-    if os.path.isdir(output_dir):
-        shutil.rmtree(output_dir)
-    os.makedirs(output_dir)
+    # human.pkl is the only output and gets overwritten, but remove the
+    # previous one so a failed video does not return stale results.
+    pklPath = os.path.join(output_dir, 'human.pkl')
+    if os.path.isfile(pklPath):
+        os.remove(pklPath)
     
     try:
         checkCudaPyTorch()
-        # Run human detection.
+        # Run human detection. The boxes and decoded frames are kept in
+        # memory and reused for pose detection.
         pathModelCkptPerson = model_ckpt_person
-        bboxPath = os.path.join(output_dir, 'box.pkl')
         full_model_config_person = model_config_person
-        detection_inference(full_model_config_person, pathModelCkptPerson,
-                            video_path, bboxPath)        
+        bboxes, frames = detection_inference(
+            full_model_config_person, pathModelCkptPerson, video_path, None,
+            device=device, det_model=det_model, batch_size=det_batch_size,
+            fp16=fp16, return_frames=True, bbox_thr=bbox_thr)        
         
         # Run pose detection.     
         pathModelCkptPose = model_ckpt_pose
-        pklPath = os.path.join(output_dir, 'human.pkl')
         videoOutPath = ''
         full_model_config_pose = model_config_pose
         pose_inference(full_model_config_pose, pathModelCkptPose, 
-                       video_path, bboxPath, pklPath, videoOutPath, 
-                       bbox_thr=bbox_thr, visualize=generateVideo)
+                       video_path, None, pklPath, videoOutPath, 
+                       device=device, bbox_thr=bbox_thr,
+                       visualize=generateVideo, model=pose_model,
+                       num_workers=pose_num_workers, bboxes=bboxes,
+                       fp16=fp16, frames=frames, channels_last=channels_last)
+        del frames
         if os.path.isfile(video_path):
             os.remove(video_path)
-        if os.path.isfile(bboxPath):
-            os.remove(bboxPath)
         
         logging.info("mmpose: Done. Cleaning up")
         
-    except:
-        logging.info("mmpose: Pose detection failed.")
-        os.remove(video_path)
+    except Exception:
+        logging.exception("mmpose: Pose detection failed.")
+        # Remove the video first so the worker stops waiting, even if the
+        # cleanup below fails.
+        if os.path.isfile(video_path):
+            os.remove(video_path)
+        # Release what the failed video left behind (eg, after a CUDA OOM)
+        # so the next one starts from a clean allocator. This raises after
+        # sticky CUDA errors (eg, illegal memory access), in which case the
+        # daemon exits and the container restarts with a fresh context.
+        bboxes = frames = None
+        gc.collect()
+        torch.cuda.empty_cache()
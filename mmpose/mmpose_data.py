@@ -16,6 +16,11 @@ class CustomVideoDataset(Dataset):
         bbox_path (str): Path to bounding box file
                          (expects format to be xyxy [left, top, right, bottom])
         pipeline (list[dict | callable]): A sequence of data transforms
+        bboxes (list, optional): Bounding boxes per frame, same format as the
+                                 bounding box file. bbox_path is not read
+                                 if provided.
+        frames (list, optional): Decoded video frames. The video is not
+                                 decoded again if provided.
     """
 
     def __init__(self,
@@ -23,15 +28,22 @@ class CustomVideoDataset(Dataset):
                  bbox_path,
                  bbox_threshold,
                  pipeline,
-                 config):
+                 config,
+                 bboxes=None,
+                 frames=None):
 
         # load video
-        self.capture = cv2.VideoCapture(video_path)
-        assert self.capture.isOpened(), f'Failed to load video file {video_path}'
-        self.frames = np.stack([x for x in frame_iter(self.capture)])
+        if frames is None:
+            self.capture = cv2.VideoCapture(video_path)
+            assert self.capture.isOpened(), f'Failed to load video file {video_path}'
+            frames = np.stack([x for x in frame_iter(self.capture)])
+        self.frames = frames
 
         # load bbox
-        self.bboxs = pickle.load(open(bbox_path, "rb"))
+        if bboxes is None:
+            with open(bbox_path, "rb") as f:
+                bboxes = pickle.load(f)
+        self.bboxs = bboxes
         self.bbox_threshold = bbox_threshold
 
         # create instance to frame and frame to instance mapping
@@ -1,4 +1,6 @@
 import cv2
+import queue
+import threading
 import numpy as np
 
 def frame_iter(capture):
@@ -6,6 +8,60 @@ def frame_iter(capture):
         yield capture.retrieve()[1]
 
 
+def batch_iter(capture, batch_size, prefetch=2):
+    """Decode frames in a background thread and yield them in lists of
+    batch_size frames, so that decoding overlaps with inference on the
+    previous batch (OpenCV releases the GIL while decoding).
+    Args:
+        capture (cv2.VideoCapture): opened video
+        batch_size (int): number of frames per batch
+        prefetch (int): number of decoded batches to buffer
+    """
+    batches = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def producer():
+        try:
+            batch = []
+            for img in frame_iter(capture):
+                batch.append(img)
+                if len(batch) == batch_size:
+                    if not put(batch):
+                        return
+                    batch = []
+            if batch:
+                put(batch)
+        except Exception as e:
+            put(e)
+        finally:
+            put(done)
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    try:
+        while True:
+            batch = batches.get()
+            if batch is done:
+                break
+            if isinstance(batch, Exception):
+                raise batch
+            yield batch
+    finally:
+        # Also stops the producer if the consumer exits early.
+        stop.set()
+        thread.join()
+
+
 class LoadImage:
     """Simple pipeline step to check channel order"""
 
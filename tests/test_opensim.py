@@ -0,0 +1,107 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+thisDir = os.path.dirname(os.path.realpath(__file__))
+repoDir = os.path.abspath(os.path.join(thisDir,'../'))
+sys.path.append(repoDir)
+from utils import numpy2TRC
+from utilsOpenSim import getScaleTimeRange, loadScaleTimeRangeData, getScaleTimeRangeFromArray
+
+OPENPOSE_MARKERS = ["Neck", "RShoulder", "LShoulder", "RHip", "LHip", "RKnee",
+                    "LKnee", "RAnkle", "LAnkle", "RHeel", "LHeel", "RSmallToe",
+                    "LSmallToe", "RElbow", "LElbow", "RWrist", "LWrist"]
+
+# Helper functions
+
+def generate_trajectories(nFrames, staticStart, staticEnd, nCoordinates=6,
+                          fs=60):
+    """
+    Generate moving trajectories (in m) that are static, and offset from the
+    motion, between frames staticStart and staticEnd (both inclusive).
+
+    Returns:
+    - time: 1D NumPy array of shape (nFrames,)
+    - data: 2D NumPy array of shape (nFrames, nCoordinates)
+    """
+    time = np.arange(nFrames) / fs
+    data = 0.1 * np.sin(2 * np.pi * time[:, None] + np.arange(nCoordinates))
+    data[staticStart:staticEnd+1, :] = 1.0
+
+    return time, data
+
+def write_trc(pathTRC, data, markers, fs=60, units='mm'):
+    with open(pathTRC, 'w') as f:
+        numpy2TRC(f, data, markers, fc=fs, units=units)
+
+# Unit tests for the static phase detection used for scaling.
+
+@pytest.mark.parametrize("staticStart, staticEnd", [
+    (0, 299), # static throughout, first 1s window
+    (120, 200), # static for more than 1s
+    (100, 130), # static for 0.5s, window gets shrunk
+])
+def test_getScaleTimeRangeFromArray(staticStart, staticEnd):
+    fs = 60
+    time, data = generate_trajectories(300, staticStart, staticEnd, fs=fs)
+
+    timeRange = getScaleTimeRangeFromArray(time, data, thresholdPosition=0.005,
+                                           thresholdTime=0.1)
+
+    # Windows start at 1s (fs+1 frames) and shrink by 0.1s (int(0.1*fs)
+    # frames) until they fit in the static phase.
+    nf = fs + 1
+    while nf > staticEnd - staticStart + 1:
+        nf -= int(0.1*fs)
+    assert timeRange[0] == pytest.approx(time[staticStart])
+    assert timeRange[1] == pytest.approx(time[staticStart+nf-1])
+
+def test_getScaleTimeRangeFromArray_no_static_phase():
+    time, data = generate_trajectories(300, 100, 102)
+
+    with pytest.raises(Exception) as excinfo:
+        getScaleTimeRangeFromArray(time, data, thresholdPosition=0.005,
+                                   thresholdTime=0.1)
+    # specific exception, see main
+    assert len(excinfo.value.args) == 2
+
+def test_getScaleTimeRangeFromArray_shorter_than_window():
+    # Trial shorter than the initial 1s window.
+    fs = 60
+    time, data = generate_trajectories(40, 0, 39, fs=fs)
+
+    timeRange = getScaleTimeRangeFromArray(time, data, thresholdPosition=0.005,
+                                           thresholdTime=0.1)
+    assert timeRange[0] == pytest.approx(time[0])
+    assert timeRange[1] <= time[-1]
+
+def test_loadScaleTimeRangeData(tmp_path):
+    fs = 60
+    nFrames = 300
+    markers = OPENPOSE_MARKERS + ['midHip']
+    _, data = generate_trajectories(nFrames, 120, 200,
+                                    nCoordinates=3*len(markers), fs=fs)
+    data *= 1000 # in mm
+    pathTRC = str(tmp_path / 'static.trc')
+    write_trc(pathTRC, data, markers, fs=fs)
+
+    time, trc_data = loadScaleTimeRangeData(
+        pathTRC, withOpenPoseMarkers=True, removeRoot=True)
+
+    # Root removed and converted to m.
+    root = data[:, -3:]
+    expected = (data[:, :-3] - np.tile(root, len(OPENPOSE_MARKERS))) / 1000
+    assert time.shape == (nFrames,)
+    assert trc_data.shape == (nFrames, 3*len(OPENPOSE_MARKERS))
+    np.testing.assert_allclose(trc_data, expected, atol=1e-6)
+
+    # The wrapper loads and searches in one call.
+    for thresholdPosition in [0.003, 0.01]:
+        assert getScaleTimeRange(
+            pathTRC, thresholdPosition=thresholdPosition, thresholdTime=0.1,
+            withOpenPoseMarkers=True, removeRoot=True) == \
+            getScaleTimeRangeFromArray(
+                time, trc_data, thresholdPosition=thresholdPosition,
+                thresholdTime=0.1)
@@ -0,0 +1,83 @@
+import os
+import pickle
+import sys
+
+import numpy as np
+import yaml
+
+thisDir = os.path.dirname(os.path.realpath(__file__))
+repoDir = os.path.abspath(os.path.join(thisDir,'../'))
+sys.path.append(repoDir)
+from utils import loadCameraParametersCached, importMetadata, _loadCameraParameters
+
+# Helper functions
+
+def write_camera_parameters(path, CamParams):
+    with open(path, 'wb') as f:
+        pickle.dump(CamParams, f)
+
+def write_metadata(path, metadata):
+    with open(path, 'w') as f:
+        yaml.dump(metadata, f)
+
+def set_mtime(path, offset_s):
+    # Explicit mtime such that rewrites are detected even if the filesystem
+    # timestamp resolution is coarse.
+    mtime_ns = os.stat(path).st_mtime_ns + int(offset_s * 1e9)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+# Unit tests for the cached loaders.
+
+def test_loadCameraParametersCached_reloads_rewritten_file(tmp_path):
+    path = str(tmp_path / 'cameraIntrinsics.pickle')
+    write_camera_parameters(path, {'intrinsicMat': np.eye(3)})
+    assert np.array_equal(loadCameraParametersCached(path)['intrinsicMat'],
+                          np.eye(3))
+
+    # Same size, only the content and mtime change.
+    write_camera_parameters(path, {'intrinsicMat': 2*np.eye(3)})
+    set_mtime(path, 1)
+    assert np.array_equal(loadCameraParametersCached(path)['intrinsicMat'],
+                          2*np.eye(3))
+
+def test_loadCameraParametersCached_returns_copies(tmp_path):
+    path = str(tmp_path / 'cameraIntrinsics.pickle')
+    write_camera_parameters(path, {'intrinsicMat': np.eye(3),
+                                   'imageSize': np.array([[720], [1280]])})
+
+    CamParams = loadCameraParametersCached(path)
+    hits = _loadCameraParameters.cache_info().hits
+    # Callers such as rotateIntrinsics modify the parameters in place.
+    CamParams['intrinsicMat'][0, 0] = 10
+    CamParams['imageSize'] = np.flipud(CamParams['imageSize'])
+    CamParams['rotation'] = np.eye(3)
+
+    CamParamsCached = loadCameraParametersCached(path)
+    assert _loadCameraParameters.cache_info().hits == hits + 1
+    assert np.array_equal(CamParamsCached['intrinsicMat'], np.eye(3))
+    assert np.array_equal(CamParamsCached['imageSize'],
+                          np.array([[720], [1280]]))
+    assert 'rotation' not in CamParamsCached
+
+def test_importMetadata_reloads_rewritten_file(tmp_path):
+    path = str(tmp_path / 'sessionMetadata.yaml')
+    write_metadata(path, {'mass_kg': 70.0, 'height_m': 1.80})
+    assert importMetadata(path)['mass_kg'] == 70.0
+
+    write_metadata(path, {'mass_kg': 80.0, 'height_m': 1.80})
+    set_mtime(path, 1)
+    assert importMetadata(path)['mass_kg'] == 80.0
+
+def test_importMetadata_returns_copies(tmp_path):
+    path = str(tmp_path / 'sessionMetadata.yaml')
+    write_metadata(path, {'iphoneModel': {'Cam0': 'iphone13,3'},
+                          'checkerBoard': {'squareSideLength_mm': 35}})
+
+    sessionMetadata = importMetadata(path)
+    sessionMetadata['iphoneModel']['Cam1'] = 'iphone12,1'
+    sessionMetadata['checkerBoard']['squareSideLength_mm'] = 0
+    del sessionMetadata['checkerBoard']
+
+    sessionMetadataCached = importMetadata(path)
+    assert sessionMetadataCached['iphoneModel'] == {'Cam0': 'iphone13,3'}
+    assert sessionMetadataCached['checkerBoard']['squareSideLength_mm'] == 35
@@ -2,6 +2,7 @@ import yaml
 import json
 import os
 import socket
+import http.cookiejar
 import requests
 import urllib.request
 import shutil
@@ -13,6 +14,9 @@ import subprocess
 import zipfile
 import time
 import datetime
+import copy
+import functools
+import threading
 
 import numpy as np
 import pandas as pd
@@ -93,9 +97,34 @@ def loadCameraParameters(filename):
     open_file.close()
     return cameraParams
 
+# Files such as camera intrinsics (shared by cameras of the same model) and
+# session metadata are loaded multiple times per trial. They are cached by
+# path and modification time, so that updated files are reloaded. Copies are
+# returned since the callers modify the loaded parameters in place.
+def _getFileCacheKey(filePath):
+    fileStat = os.stat(filePath)
+    return filePath, fileStat.st_mtime_ns, fileStat.st_size
+
+@functools.lru_cache(maxsize=64)
+def _loadCameraParameters(filename, mtime, size):
+    return loadCameraParameters(filename)
+
+def loadCameraParametersCached(filename):
+    return copy.deepcopy(_loadCameraParameters(*_getFileCacheKey(filename)))
+
+# Use the LibYAML-based loader when available, it is much faster than the
+# pure Python one.
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+@functools.lru_cache(maxsize=32)
+def _importMetadata(filePath, mtime, size):
+    with open(filePath) as myYamlFile:
+        parsedYamlFile = yaml.load(myYamlFile, Loader=_YAML_LOADER)
+    
+    return parsedYamlFile
+
 def importMetadata(filePath):
-    myYamlFile = open(filePath)
-    parsedYamlFile = yaml.load(myYamlFile, Loader=yaml.FullLoader)
+    parsedYamlFile = copy.deepcopy(_importMetadata(*_getFileCacheKey(filePath)))
     
     return parsedYamlFile
 
@@ -1751,13 +1780,16 @@ def postLocalClientInfo(trial_url):
     
     return r
 
-def postProcessedDuration(trial_url, duration):
+def postProcessedDuration(trial_url, duration, status=None):
     """Given a trial_url and duration (formed from difference in datetime
-    objects), updates the Trial field for 'processed_duration'.
+    objects), updates the Trial field for 'processed_duration'. If status is
+    provided, it is updated in the same request.
     """
     data = {
         "processed_duration": duration
     }
+    if status is not None:
+        data["status"] = status
     r = makeRequestWithRetry('PATCH',
                              trial_url,
                              data=data,
@@ -1785,22 +1817,39 @@ def makeRequestWithRetry(method, url,
     Returns:
         requests.Response: The response object for further processing.
     """
-    retry_strategy = Retry(
-        total=retries,
-        backoff_factor=backoff_factor,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods={'DELETE', 'GET', 'POST', 'PUT', 'PATCH'}
-    )
-
-    adapter = requests.adapters.HTTPAdapter(max_retries=retry_strategy)
-    with requests.Session() as session:
-        session.mount("https://", adapter)
-        response = session.request(method,
-                                    url,
-                                    headers=headers,
-                                    data=data,
-                                    params=params,
-                                    files=files)
+    session = _getRetrySession(retries, backoff_factor)
+    response = session.request(method,
+                               url,
+                               headers=headers,
+                               data=data,
+                               params=params,
+                               files=files)
     response.raise_for_status()
     return response
 
+# Sessions used by makeRequestWithRetry, such that connections to the API are
+# kept alive across requests. requests.Session is not thread-safe, so there is
+# one session per thread and retry strategy.
+_retrySessions = threading.local()
+
+def _getRetrySession(retries, backoff_factor):
+    if not hasattr(_retrySessions, 'sessions'):
+        _retrySessions.sessions = {}
+    key = (retries, backoff_factor)
+    if key not in _retrySessions.sessions:
+        retry_strategy = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods={'DELETE', 'GET', 'POST', 'PUT', 'PATCH'}
+        )
+
+        adapter = requests.adapters.HTTPAdapter(max_retries=retry_strategy)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        # Do not persist cookies across requests, as with one-off requests.
+        session.cookies.set_policy(
+            http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        _retrySessions.sessions[key] = session
+    
+    return _retrySessions.sessions[key]
@@ -58,6 +58,13 @@ def getAppPullWaitTimeAndJitter():
 
     return time, jitter
 
+def getAppPullMaxWaitTime():
+    return config('APP_PULL_MAX_WAIT_TIME', default=60.0, cast=float)
+
+def getAppPullLongPollWaitTime():
+    # 0 disables long polling (the API returns 404 right away if no trial).
+    return config('APP_PULL_LONG_POLL_WAIT_TIME', default=0.0, cast=float)
+
 def getLogLevel():
     log_level_str = config('LOG_LEVEL', default='INFO')
     log_level = getattr(logging, log_level_str.upper(), logging.INFO)
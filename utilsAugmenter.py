@@ -162,4 +162,4 @@ def augmentTRC(pathInputTRCFile, subject_mass, subject_height,
     # %% Return augmented .trc file   
     trc_file.write(pathOutputTRCFile)
     
-    return min_y_pos
+    return float(min_y_pos)
@@ -1,9 +1,10 @@
 import cv2
 import pickle
 import torch
+import numpy as np
 
 # from tqdm import tqdm
-from mmpose_utils import process_mmdet_results, frame_iter, concat, convert_instance_to_frame
+from mmpose_utils import process_mmdet_results, batch_iter, concat, convert_instance_to_frame
 try:
     from mmdet.apis import inference_detector, init_detector
     has_mmdet = True
@@ -17,6 +18,10 @@ from torch.utils.data import DataLoader
 from mmpose.apis import vis_pose_tracking_result
 from mmpose.datasets import DatasetInfo
 
+# torch.inference_mode (no autograd, view or version tracking) is only
+# available from torch 1.9 on.
+inference_mode = getattr(torch, 'inference_mode', torch.no_grad)
+
 # %%
 def get_dataset_info():
     
@@ -30,44 +35,116 @@ def get_dataset_info():
     
     return dataset_info
 
+# %%
+def detect_person_batch(det_model, imgs, det_cat_id=1, fp16=False,
+                        bbox_thr=None):
+    """Run the detector on a list of frames, return the person boxes
+    (x1, y1, x2, y2, score) of each frame, only those with a score of at
+    least bbox_thr if provided."""
+    
+    with inference_mode(), torch.cuda.amp.autocast(enabled=fp16):
+        mmdet_results = inference_detector(det_model, imgs)
+    
+    # keep the person class bounding boxes.
+    person_results = [process_mmdet_results(mmdet_result, det_cat_id)
+                      for mmdet_result in mmdet_results]
+    if bbox_thr is not None:
+        person_results = [
+            [person for person in frame if person['bbox'][4] >= bbox_thr]
+            for frame in person_results]
+    
+    return person_results
+
+# %%
+def warmup_models(det_model, pose_model, det_batch_size=1,
+                  pose_batch_size=64, frame_sizes=[(720, 1280), (1280, 720)],
+                  n_iters=3, fp16=False, channels_last=False):
+    """Run both models on dummy inputs so that cuDNN autotuning (with
+    torch.backends.cudnn.benchmark) and the allocator growth happen before
+    the first video. frame_sizes are (height, width) of the expected videos,
+    both orientations by default.
+    """
+    
+    for height, width in frame_sizes:
+        imgs = [np.zeros((height, width, 3), dtype=np.uint8)] * det_batch_size
+        for _ in range(n_iters):
+            detect_person_batch(det_model, imgs, fp16=fp16)
+    
+    # pose crops always have the model input size.
+    image_width, image_height = pose_model.cfg.data_cfg['image_size']
+    device = next(pose_model.parameters()).device
+    img = torch.zeros((pose_batch_size, 3, image_height, image_width),
+                      device=device)
+    if channels_last:
+        img = img.contiguous(memory_format=torch.channels_last)
+    with inference_mode(), torch.cuda.amp.autocast(enabled=fp16):
+        for _ in range(n_iters):
+            pose_model.forward_dummy(img)
+    torch.cuda.synchronize(device)
+
 # %%
 def detection_inference(model_config, model_ckpt, video_path, bbox_path,
-                        device='cuda:0', det_cat_id=1):
+                        device='cuda:0', det_cat_id=1, det_model=None,
+                        batch_size=1, fp16=False, return_frames=False,
+                        bbox_thr=None):
     
     """Visualize the demo images.
 
-    Using mmdet to detect the human.
+    Using mmdet to detect the human. Pass det_model to reuse an already
+    initialized detector. Frames are run through the detector batch_size
+    at a time. Returns the person boxes of each frame, which are also
+    pickled to bbox_path unless it is None. Set fp16 to run the detector
+    under CUDA autocast. With return_frames, the decoded frames are returned
+    as well, so that pose_inference does not decode the video again. Boxes
+    with a score below bbox_thr are dropped if provided.
     """
 
-    det_model = init_detector(
-        model_config, model_ckpt, device=device.lower())
+    if det_model is None:
+        det_model = init_detector(
+            model_config, model_ckpt, device=device.lower())
 
     cap = cv2.VideoCapture(video_path)
     assert cap.isOpened(), f'Faild to load video file {video_path}'
 
     output = []
+    frames = []
     nFrames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    # for img in tqdm(frame_iter(cap), total=nFrames):
-    for img in frame_iter(cap):
-        # test a single image, the resulting box is (x1, y1, x2, y2)
-        mmdet_results = inference_detector(det_model, img)
-
-        # keep the person class bounding boxes.
-        person_results = process_mmdet_results(mmdet_results, det_cat_id)
-        output.append(person_results)
-
-    output_file = bbox_path
-    pickle.dump(output, open(str(output_file), 'wb'))
+    # frames are decoded in a background thread while the detector runs.
+    for batch in batch_iter(cap, batch_size):
+        output.extend(detect_person_batch(det_model, batch, det_cat_id,
+                                          fp16=fp16, bbox_thr=bbox_thr))
+        if return_frames:
+            frames.extend(batch)
+
+    if bbox_path is not None:
+        output_file = bbox_path
+        with open(str(output_file), 'wb') as f:
+            pickle.dump(output, f)
     cap.release()
     
+    if return_frames:
+        return output, frames
+    return output
+    
 # %%
 def pose_inference(model_config, model_ckpt, video_path, bbox_path, pkl_path,
                    video_out_path, device='cuda:0', batch_size=64,
-                   bbox_thr=0.95, visualize=True, save_results=True):
-    """Run pose inference on custom video dataset"""
+                   bbox_thr=0.95, visualize=True, save_results=True,
+                   model=None, num_workers=0, bboxes=None, fp16=False,
+                   frames=None, channels_last=False):
+    """Run pose inference on custom video dataset
+
+    With num_workers > 0, crops are preprocessed in DataLoader worker
+    processes while the model runs on the previous batch. Pass the output
+    of detection_inference as bboxes to skip loading bbox_path, and its
+    frames to skip decoding the video again. Set fp16 to run the model under
+    CUDA autocast. Set channels_last to feed NHWC batches, to be used with a
+    model converted to torch.channels_last.
+    """
 
-    # init model
-    model = init_pose_model(model_config, model_ckpt, device)
+    # init model, unless an already initialized one is passed
+    if model is None:
+        model = init_pose_model(model_config, model_ckpt, device)
     model_name = model_config.split("/")[1].split(".")[0]
     print("Initializing {} Model".format(model_name))
 
@@ -79,10 +156,20 @@ def pose_inference(model_config, model_ckpt, video_path, bbox_path, pkl_path,
     dataset = CustomVideoDataset(video_path=video_path,
                                  bbox_path=bbox_path,
                                  bbox_threshold=bbox_thr,
+                                 bboxes=bboxes,
+                                 frames=frames,
                                  pipeline=test_pipeline,
                                  config=model.cfg)
+    # frames without any box above bbox_thr have no instance and are not
+    # run through the model. If there is no instance at all, stop here.
+    if len(dataset) == 0:
+        raise Exception("No person detected with a score of at least {} in {}.".format(
+            bbox_thr, video_path))
+    # pinned batches so the host to device copy can be asynchronous.
+    use_cuda = str(device).lower().startswith('cuda')
     dataloader = DataLoader(dataset, batch_size=batch_size,
-                            shuffle=False, collate_fn=collate)
+                            shuffle=False, collate_fn=collate,
+                            num_workers=num_workers, pin_memory=use_cuda)
     print("Building {} Custom Video Dataset".format(video_basename))
 
     # run pose inference
@@ -90,9 +177,12 @@ def pose_inference(model_config, model_ckpt, video_path, bbox_path, pkl_path,
     instances = []
     # for batch in tqdm(dataloader):
     for batch in dataloader:
-        batch['img'] = batch['img'].to(device)
+        batch['img'] = batch['img'].to(device, non_blocking=use_cuda)
+        if channels_last:
+            batch['img'] = batch['img'].contiguous(
+                memory_format=torch.channels_last)
         batch['img_metas'] = [img_metas[0] for img_metas in batch['img_metas'].data]
-        with torch.no_grad():
+        with inference_mode(), torch.cuda.amp.autocast(enabled=fp16):
             result = run_pose_inference(model, batch)
         instances.append(result)
 
@@ -111,6 +201,7 @@ def pose_inference(model_config, model_ckpt, video_path, bbox_path, pkl_path,
             pickle.dump(results, f)
 
     # visualzize
+    video_frames = dataset.frames
     if visualize:
         print("Rendering Visualization...")
         cap = cv2.VideoCapture(video_path)
@@ -124,8 +215,8 @@ def pose_inference(model_config, model_ckpt, video_path, bbox_path, pkl_path,
         dataset = model.cfg.data.test.type
         dataset_info_d = get_dataset_info()
         dataset_info = DatasetInfo(dataset_info_d[dataset])
-        # for pose_results, img in tqdm(zip(results, frame_iter(cap))):
-        for pose_results, img in zip(results, frame_iter(cap)):        
+        # reuse the frames decoded for the dataset.
+        for pose_results, img in zip(results, video_frames):        
             for instance in pose_results:
                 instance['keypoints'] = instance['preds_with_flip']
             vis_img = vis_pose_tracking_result(model, img, pose_results,
@@ -238,6 +238,20 @@ def getScaleTimeRange(pathTRCFile, thresholdPosition=0.005, thresholdTime=0.3,
                       withArms=True, withOpenPoseMarkers=False, isMocap=False,
                       removeRoot=False):
     
+    c_trc_time, trc_data = loadScaleTimeRangeData(
+        pathTRCFile, withArms=withArms, 
+        withOpenPoseMarkers=withOpenPoseMarkers, isMocap=isMocap,
+        removeRoot=removeRoot)
+    
+    return getScaleTimeRangeFromArray(c_trc_time, trc_data, 
+                                      thresholdPosition=thresholdPosition,
+                                      thresholdTime=thresholdTime)
+
+# %% Marker trajectories used to detect the static phase (in m).
+def loadScaleTimeRangeData(pathTRCFile, withArms=True, 
+                           withOpenPoseMarkers=False, isMocap=False,
+                           removeRoot=False):
+    
     c_trc_file = utilsDataman.TRCFile(pathTRCFile)
     c_trc_time = c_trc_file.time    
     if withOpenPoseMarkers:
@@ -294,6 +308,13 @@ def getScaleTimeRange(pathTRCFile, thresholdPosition=0.005, thresholdTime=0.3,
     if np.max(trc_data)>10: # in mm, turn to m
         trc_data/=1000
         
+    return c_trc_time, trc_data
+
+# %% Detect the first static window, starting with 1s windows and shrinking
+# them by 0.1s until one is found or they get shorter than thresholdTime.
+def getScaleTimeRangeFromArray(c_trc_time, trc_data, thresholdPosition=0.005,
+                               thresholdTime=0.3):
+        
     # Sampling frequency.
     sf = np.round(1/np.mean(np.diff(c_trc_time)),4)
     # Minimum duration for time range in seconds.
@@ -301,19 +322,20 @@ def getScaleTimeRange(pathTRCFile, thresholdPosition=0.005, thresholdTime=0.3,
     # Corresponding number of frames.
     nf = int(timeRange_min*sf + 1)
     
+    nFrames = trc_data.shape[0]
     detectedWindow = False
-    i = 0
     while not detectedWindow:
-        c_window = trc_data[i:i+nf,:]
-        c_window_max = np.max(c_window, axis=0)
-        c_window_min = np.min(c_window, axis=0)
-        c_window_diff = np.abs(c_window_max - c_window_min)
-        detectedWindow = np.alltrue(c_window_diff<thresholdPosition)
+        if nf <= nFrames:
+            # Range of each coordinate over all windows of nf frames.
+            c_windows = np.lib.stride_tricks.sliding_window_view(
+                trc_data, nf, axis=0)
+            c_windows_diff = np.max(c_windows, axis=-1) - np.min(c_windows, axis=-1)
+            c_windows_static = np.all(c_windows_diff < thresholdPosition, axis=1)
+            if np.any(c_windows_static):
+                i = int(np.argmax(c_windows_static))
+                detectedWindow = True
         if not detectedWindow:
-            i += 1
-            if i > c_trc_time.shape[0]-nf:
-                i = 0
-                nf -= int(0.1*sf) 
+            nf -= int(0.1*sf) 
             if np.round((nf-1)/sf,2) < thresholdTime: # number of frames got too small without detecting a window
                 exception = "Musculoskeletal model scaling failed; could not detect a static phase of at least %.2fs. After you press record, make sure the subject stands still until the message tells you they can relax . Visit https://www.opencap.ai/best-pratices to learn more about data collection." % thresholdTime
                 raise Exception(exception, exception)